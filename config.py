@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 class Settings(BaseSettings):
     # Database
@@ -9,7 +10,11 @@ class Settings(BaseSettings):
     
     # File handling
     max_file_size: int = 50 * 1024 * 1024  # 50MB
+    upload_chunk_size: int = 64 * 1024  # 64KB read per chunk
     allowed_file_types: list = [".json", ".csv"]
+    csv_validation_rows: int = 1000  # Rows checked when validating CSV uploads
+    upload_storage_dir: Optional[str] = None  # Parent of the per-process upload dir; system temp dir if unset
+    file_cache_max_bytes: int = 256 * 1024 * 1024  # 256MB of file contents kept in memory
     
     # Processing
     processing_delay: int = 5  # Simulate processing time in seconds
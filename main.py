@@ -1,24 +1,47 @@
 # File: main.py
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import uvicorn
-from typing import List, Optional
-from datetime import datetime
-import json
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+import orjson
 import csv
 import io
+import re
+from itertools import islice
 
 from config import get_settings
+from models.database import db
 from models.schemas import *
 from services.upload_service import UploadService
-from services.processing_service import ProcessingService
+from services.processing_service import ProcessingService, shutdown_process_pool, summarize_json_file
 from dependencies import get_upload_service, get_processing_service
 
+class UTCORJSONResponse(ORJSONResponse):
+    """orjson response that writes UTC datetimes with a Z suffix, matching Pydantic output"""
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+        )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    shutdown_process_pool()
+    db.close_storage()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Chat Upload API",
     description="A SaaS API for uploading and processing chat files",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=UTCORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -32,13 +55,16 @@ app.add_middleware(
 
 settings = get_settings()
 
+# Leading whitespace then '[' or '{'; matched in place without copying the payload
+JSON_CONTAINER_START = re.compile(rb"[ \t\r\n]*[\[{]")
+
 # Health Check Endpoint
 @app.get("/api/v1/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint for monitoring"""
     return HealthResponse(
         status="healthy",
-        timestamp=datetime.utcnow(),
+        timestamp=datetime.now(timezone.utc),
         version="1.0.0"
     )
 
@@ -51,33 +77,26 @@ async def upload_files(
 ):
     """Upload one or multiple chat files"""
     try:
+        # Read and validate all files concurrently; nothing is stored unless all pass
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tasks = [tg.create_task(_read_chat_file(file)) for file in files]
+        except ExceptionGroup as eg:
+            raise eg.exceptions[0]
+        
         uploads = []
         
-        for file in files:
-            # Validate file
-            if not file.filename.endswith(('.json', '.csv')):
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Unsupported file type: {file.filename}"
-                )
-            
-            # Read and validate file content
-            content = await file.read()
-            if len(content) > settings.max_file_size:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"File {file.filename} exceeds maximum size limit"
-                )
-            
-            # Validate file format
-            await _validate_chat_file(content, file.filename)
+        for file, task in zip(files, tasks):
+            file_type, content, content_summary = task.result()
             
             # Create upload record
             upload = await upload_service.create_upload(
                 customer_id=customer_id,
                 filename=file.filename,
+                file_type=file_type,
                 file_content=content,
-                file_size=len(content)
+                file_size=len(content),
+                content_summary=content_summary
             )
             uploads.append(upload)
         
@@ -94,8 +113,8 @@ async def upload_files(
 @app.get("/api/v1/uploads", response_model=UploadListResponse)
 async def list_uploads(
     customer_id: str,
-    skip: int = 0,
-    limit: int = 100,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=0),
     status: Optional[str] = None,
     upload_service: UploadService = Depends(get_upload_service)
 ):
@@ -114,24 +133,30 @@ async def list_uploads(
         limit=limit
     )
 
-@app.get("/api/v1/uploads/{upload_id}/status", response_model=UploadStatusResponse)
+# Polled by clients, so the response is built directly instead of through a model;
+# UploadStatusResponse still documents its shape
+@app.get(
+    "/api/v1/uploads/{upload_id}/status",
+    response_model=None,
+    responses={200: {"model": UploadStatusResponse}}
+)
 async def get_upload_status(
     upload_id: str,
     customer_id: str,
     upload_service: UploadService = Depends(get_upload_service)
-):
+) -> UTCORJSONResponse:
     """Get processing status of a specific upload"""
     upload = await upload_service.get_upload(upload_id, customer_id)
     if not upload:
         raise HTTPException(status_code=404, detail="Upload not found")
     
-    return UploadStatusResponse(
-        upload_id=upload_id,
-        status=upload.status,
-        progress=upload.progress,
-        processing_started_at=upload.processing_started_at,
-        processing_completed_at=upload.processing_completed_at
-    )
+    return UTCORJSONResponse({
+        "upload_id": upload_id,
+        "status": upload.status.value,
+        "progress": upload.progress,
+        "processing_started_at": upload.processing_started_at,
+        "processing_completed_at": upload.processing_completed_at
+    })
 
 @app.get("/api/v1/uploads/{upload_id}/results", response_model=ProcessingResultsResponse)
 async def get_processing_results(
@@ -184,19 +209,66 @@ async def get_dashboard_summary(
     summary = await upload_service.get_customer_summary(customer_id)
     return summary
 
-# Utility function for file validation
-async def _validate_chat_file(content: bytes, filename: str):
-    """Validate that the uploaded file is a valid chat file"""
+# Utility functions for file reading and validation
+async def _read_chat_file(file: UploadFile) -> Tuple[FileType, bytes, Optional[Dict[str, Any]]]:
+    """Read and validate one uploaded chat file, returning its type, content and JSON summary"""
+    file_type = FileType.from_filename(file.filename)
+    if file_type is None:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Unsupported file type: {file.filename}"
+        )
+    
+    # Read file content, enforcing the size limit as chunks arrive
+    content = await _read_upload_file(file)
+    
+    # Validate file format, keeping the JSON summary for processing
+    content_summary = await _validate_chat_file(content, file.filename, file_type)
+    return file_type, content, content_summary
+
+async def _read_upload_file(file: UploadFile) -> bytes:
+    """Read an uploaded file, rejecting it before reading if it exceeds the size limit"""
+    size_error = HTTPException(
+        status_code=400,
+        detail=f"File {file.filename} exceeds maximum size limit"
+    )
+    
+    if file.size is None:
+        # Size unknown: measure it in chunks without keeping them, then rewind
+        size = 0
+        while chunk := await file.read(settings.upload_chunk_size):
+            size += len(chunk)
+            if size > settings.max_file_size:
+                raise size_error
+        await file.seek(0)
+    elif file.size > settings.max_file_size:
+        raise size_error
+    
+    return await file.read()
+
+async def _validate_chat_file(content: bytes, filename: str,
+                              file_type: FileType) -> Optional[Dict[str, Any]]:
+    """Validate that the uploaded file is a valid chat file, returning a JSON file's summary"""
     try:
-        if filename.endswith('.json'):
-            data = json.loads(content.decode('utf-8'))
-            if not isinstance(data, (list, dict)):
+        if file_type == FileType.JSON:
+            # Reject scalars before paying for a full parse
+            if not JSON_CONTAINER_START.match(content):
                 raise ValueError("JSON must be an object or array")
-        elif filename.endswith('.csv'):
-            text_content = content.decode('utf-8')
-            csv_reader = csv.reader(io.StringIO(text_content))
-            # Just check if it's valid CSV
-            list(csv_reader)
+            # Parsed off the event loop; only the small summary comes back
+            return await summarize_json_file(content)
+        elif file_type == FileType.CSV:
+            # Decode incrementally instead of copying the whole file into a str
+            text_stream = io.TextIOWrapper(io.BytesIO(content), encoding='utf-8', newline='')
+            csv_reader = csv.reader(text_stream)
+            # Just check that the first rows are valid CSV
+            for _ in islice(csv_reader, settings.csv_validation_rows):
+                pass
+            # The rest of the file must still be valid UTF-8
+            while text_stream.read(settings.upload_chunk_size):
+                pass
+        return None
+    except BrokenProcessPool:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=400,
@@ -204,4 +276,4 @@ async def _validate_chat_file(content: bytes, filename: str):
         )
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
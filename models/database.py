@@ -1,33 +1,133 @@
-from typing import Dict, List, Optional
-from datetime import datetime
+from typing import Any, DefaultDict, Dict, List, Optional
+from collections import Counter, OrderedDict, defaultdict
+from datetime import date, datetime, timezone
+from itertools import islice
+import asyncio
+import atexit
+import os
+import shutil
+import tempfile
+import time
 import uuid
-from .schemas import Upload, UploadStatus, ProcessingResult
+
+import aiofiles
+import aiofiles.os
+
+from config import get_settings
+from .schemas import FileType, Upload, UploadStatus, ProcessingResult
+
+settings = get_settings()
+
+# Timestamps within a burst of writes share one clock read
+_CLOCK_RESOLUTION = 0.001  # seconds
+_cached_now = datetime.now(timezone.utc)
+_cached_at = time.monotonic()
+
+def utcnow() -> datetime:
+    """Current UTC time, reused for up to a millisecond between calls"""
+    global _cached_now, _cached_at
+    now = time.monotonic()
+    if now - _cached_at > _CLOCK_RESOLUTION:
+        _cached_now = datetime.now(timezone.utc)
+        _cached_at = now
+    return _cached_now
+
+class FileContentCache:
+    """Least-recently-used cache of file contents, bounded by total size in bytes"""
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+    
+    def get(self, key: str) -> Optional[bytes]:
+        content = self.entries.get(key)
+        if content is not None:
+            self.entries.move_to_end(key)
+        return content
+    
+    def put(self, key: str, content: bytes):
+        self.pop(key)
+        if len(content) > self.max_bytes:
+            return
+        
+        self.entries[key] = content
+        self.size += len(content)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+    
+    def pop(self, key: str):
+        content = self.entries.pop(key, None)
+        if content is not None:
+            self.size -= len(content)
 
 class InMemoryDatabase:
-    """Simple in-memory database for the demo"""
+    """Simple in-memory database for the demo, with file contents kept on disk"""
     
-    def __init__(self):
+    def __init__(self, cache_max_bytes: int = settings.file_cache_max_bytes):
         self.uploads: Dict[str, Upload] = {}
-        self.file_contents: Dict[str, bytes] = {}
+        # Created on first use; file contents never outlive the in-memory index
+        self.storage_dir: Optional[str] = None
+        # Recently written or read files stay in memory; the rest are read back from disk
+        self.file_cache = FileContentCache(cache_max_bytes)
+        # Small summaries computed while validating uploads, reused by processing
+        self.content_summaries: Dict[str, Dict[str, Any]] = {}
         self.processing_results: Dict[str, List[ProcessingResult]] = {}
+        # Secondary indexes per customer; uploads are kept in insertion
+        # (upload timestamp) order so listings can walk them newest first
+        self.customer_uploads: DefaultDict[str, Dict[str, Upload]] = defaultdict(dict)
+        self.status_counts: DefaultDict[str, Counter[UploadStatus]] = defaultdict(Counter)
+        # Dashboard aggregates per customer, maintained on every write
+        self.total_file_sizes: DefaultDict[str, int] = defaultdict(int)
+        self.daily_upload_counts: DefaultDict[str, Counter[date]] = defaultdict(Counter)
+        # Per-upload locks, so writers to one upload never wait on another
+        self.upload_locks: DefaultDict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
     
-    async def create_upload(self, customer_id: str, filename: str, 
-                          file_content: bytes, file_size: int) -> Upload:
+    def _ensure_storage(self) -> str:
+        """Return this process's file directory, creating a fresh one on first use"""
+        if self.storage_dir is None:
+            parent_dir = settings.upload_storage_dir
+            if parent_dir:
+                os.makedirs(parent_dir, exist_ok=True)
+            self.storage_dir = tempfile.mkdtemp(prefix="chat-uploads-", dir=parent_dir)
+            # Also cleaned up when the app runs without its lifespan shutdown
+            atexit.register(self.close_storage)
+        return self.storage_dir
+    
+    def close_storage(self):
+        """Remove this process's file contents along with their directory"""
+        if self.storage_dir is not None:
+            shutil.rmtree(self.storage_dir, ignore_errors=True)
+            self.storage_dir = None
+        self.file_cache = FileContentCache(self.file_cache.max_bytes)
+    
+    async def create_upload(self, customer_id: str, filename: str, file_type: FileType,
+                          file_content: bytes, file_size: int,
+                          content_summary: Optional[Dict[str, Any]] = None) -> Upload:
         upload_id = str(uuid.uuid4())
-        file_type = filename.split('.')[-1].lower()
         
-        upload = Upload(
+        async with aiofiles.open(self._file_path(upload_id), 'wb') as f:
+            await f.write(file_content)
+        self.file_cache.put(upload_id, file_content)
+        
+        upload = Upload.model_construct(
             id=upload_id,
             customer_id=customer_id,
             filename=filename,
             file_type=file_type,
             file_size=file_size,
-            upload_timestamp=datetime.utcnow(),
+            upload_timestamp=utcnow(),
             status=UploadStatus.PENDING
         )
         
         self.uploads[upload_id] = upload
-        self.file_contents[upload_id] = file_content
+        self.customer_uploads[customer_id][upload_id] = upload
+        self.status_counts[customer_id][upload.status] += 1
+        self.total_file_sizes[customer_id] += file_size
+        self.daily_upload_counts[customer_id][upload.upload_timestamp.date()] += 1
+        if content_summary is not None:
+            self.content_summaries[upload_id] = content_summary
         return upload
     
     async def get_upload(self, upload_id: str, customer_id: str) -> Optional[Upload]:
@@ -38,46 +138,90 @@ class InMemoryDatabase:
     
     async def update_upload_status(self, upload_id: str, status: UploadStatus, 
                                  progress: int = 0) -> bool:
-        if upload_id in self.uploads:
-            upload = self.uploads[upload_id]
+        if upload_id not in self.uploads:
+            return False
+        
+        async with self.upload_locks[upload_id]:
+            # The upload may have been deleted while waiting for the lock
+            upload = self.uploads.get(upload_id)
+            if not upload:
+                return False
+            
+            counts = self.status_counts[upload.customer_id]
+            counts[upload.status] -= 1
+            counts[status] += 1
             upload.status = status
             upload.progress = progress
             
             if status == UploadStatus.PROCESSING and not upload.processing_started_at:
-                upload.processing_started_at = datetime.utcnow()
+                upload.processing_started_at = utcnow()
             elif status == UploadStatus.COMPLETED:
-                upload.processing_completed_at = datetime.utcnow()
+                upload.processing_completed_at = utcnow()
                 upload.progress = 100
                 
             return True
-        return False
     
     async def list_uploads(self, customer_id: str, skip: int = 0, 
                          limit: int = 100, status: Optional[str] = None) -> List[Upload]:
-        customer_uploads = [
-            upload for upload in self.uploads.values() 
-            if upload.customer_id == customer_id
-        ]
+        customer_uploads = self.customer_uploads.get(customer_id)
+        if not customer_uploads:
+            return []
         
+        # Newest first, without sorting
+        uploads = reversed(customer_uploads.values())
         if status:
-            customer_uploads = [u for u in customer_uploads if u.status == status]
+            uploads = (u for u in uploads if u.status == status)
         
-        # Sort by upload timestamp, newest first
-        customer_uploads.sort(key=lambda x: x.upload_timestamp, reverse=True)
-        
-        return customer_uploads[skip:skip + limit]
+        return list(islice(uploads, skip, skip + limit))
+    
+    async def get_status_counts(self, customer_id: str) -> Counter[UploadStatus]:
+        return Counter(self.status_counts.get(customer_id, {}))
+    
+    async def get_total_file_size(self, customer_id: str) -> int:
+        return self.total_file_sizes.get(customer_id, 0)
+    
+    async def count_uploads_on(self, customer_id: str, day: date) -> int:
+        return self.daily_upload_counts.get(customer_id, {}).get(day, 0)
     
     async def delete_upload(self, upload_id: str, customer_id: str) -> bool:
-        upload = await self.get_upload(upload_id, customer_id)
-        if upload:
-            del self.uploads[upload_id]
-            self.file_contents.pop(upload_id, None)
+        if not await self.get_upload(upload_id, customer_id):
+            return False
+        
+        async with self.upload_locks[upload_id]:
+            upload = self.uploads.pop(upload_id, None)
+            if not upload:
+                return False
+            
+            del self.customer_uploads[customer_id][upload_id]
+            self.status_counts[customer_id][upload.status] -= 1
+            self.total_file_sizes[customer_id] -= upload.file_size
+            self.daily_upload_counts[customer_id][upload.upload_timestamp.date()] -= 1
+            self.file_cache.pop(upload_id)
+            try:
+                await aiofiles.os.remove(self._file_path(upload_id))
+            except FileNotFoundError:
+                pass
+            self.content_summaries.pop(upload_id, None)
             self.processing_results.pop(upload_id, None)
-            return True
-        return False
+        
+        self.upload_locks.pop(upload_id, None)
+        return True
     
     async def get_file_content(self, upload_id: str) -> Optional[bytes]:
-        return self.file_contents.get(upload_id)
+        content = self.file_cache.get(upload_id)
+        if content is not None:
+            return content
+        
+        try:
+            async with aiofiles.open(self._file_path(upload_id), 'rb') as f:
+                content = await f.read()
+        except FileNotFoundError:
+            return None
+        self.file_cache.put(upload_id, content)
+        return content
+    
+    async def get_content_summary(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        return self.content_summaries.get(upload_id)
     
     async def save_processing_results(self, upload_id: str, 
                                     results: List[ProcessingResult]):
@@ -85,6 +229,9 @@ class InMemoryDatabase:
     
     async def get_processing_results(self, upload_id: str) -> List[ProcessingResult]:
         return self.processing_results.get(upload_id, [])
+    
+    def _file_path(self, upload_id: str) -> str:
+        return os.path.join(self._ensure_storage(), upload_id)
 
 # Global database instance
 db = InMemoryDatabase()
\ No newline at end of file
@@ -9,11 +9,25 @@ class UploadStatus(str, Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+class FileType(str, Enum):
+    JSON = "json"
+    CSV = "csv"
+    
+    @classmethod
+    def from_filename(cls, filename: str) -> Optional["FileType"]:
+        """Classify a file by its extension, or None if it is not supported"""
+        # Suffix slices avoid splitting the filename into a list
+        if filename[-5:] == ".json":
+            return cls.JSON
+        if filename[-4:] == ".csv":
+            return cls.CSV
+        return None
+
 class Upload(BaseModel):
     id: str
     customer_id: str
     filename: str
-    file_type: str
+    file_type: FileType
     file_size: int
     upload_timestamp: datetime
     status: UploadStatus
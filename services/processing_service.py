@@ -1,13 +1,136 @@
 import asyncio
-import json
 import csv
 import io
-from typing import List
-from datetime import datetime
-import random
+import multiprocessing
+import orjson
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional
 
-from models.database import db
-from models.schemas import ProcessingResult, UploadStatus
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from models.database import db, utcnow
+from models.schemas import FileType, ProcessingResult, Upload, UploadStatus
+
+SENTIMENTS = ["positive", "neutral", "negative"]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+
+# Mock metrics for a file are drawn together in one batched call
+_rng = np.random.default_rng()
+
+# Parsing is CPU-bound, so it runs in worker processes to keep the event loop free
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # The server has live threads by now, and forking those can leave a child
+        # holding a lock forever; workers are started from a clean forkserver instead
+        _process_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("forkserver"))
+    return _process_pool
+
+async def _run_in_process_pool(func: Callable[..., Any], *args: Any) -> Any:
+    """Run a function in the process pool, replacing the pool if a worker died"""
+    global _process_pool
+    loop = asyncio.get_running_loop()
+    pool = _get_process_pool()
+    try:
+        return await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        # A dead worker (e.g. killed for memory) breaks the whole pool for good. The job
+        # is not retried, since it may be what killed the worker; later calls get a new pool
+        if _process_pool is pool:
+            _process_pool = None
+        pool.shutdown(wait=False)
+        raise
+
+async def summarize_json_file(content: bytes) -> Dict[str, Any]:
+    """Parse a JSON chat file in the process pool, returning only its message summary"""
+    return await _run_in_process_pool(_parse_json_file, content)
+
+def shutdown_process_pool():
+    """Stop the parsing worker processes, if any were started"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+
+def _parse_json_file(content: bytes) -> Dict[str, Any]:
+    """Count messages and participants in a JSON chat file"""
+    try:
+        data = orjson.loads(content)
+    except orjson.JSONDecodeError as e:
+        # Pickling the original error would send the whole document back to the caller
+        raise ValueError(str(e)) from None
+    
+    if isinstance(data, list):
+        message_count = len(data)
+        # orjson only produces plain dicts, so an exact type check is enough
+        participants = {
+            item['sender'] for item in data
+            if type(item) is dict and 'sender' in item
+        }
+    else:
+        message_count = 1
+        participants = {"unknown"}
+    
+    return {"message_count": message_count, "participants": list(participants)}
+
+def _parse_csv_file(content: bytes) -> Dict[str, Any]:
+    """Count rows and columns in a CSV chat file"""
+    if not content.strip():
+        return {"total_rows": 0, "columns": []}
+    # pyarrow cannot infer the columns of a final line without a newline
+    if not content.endswith(b"\n"):
+        content += b"\n"
+    
+    # Rows with a mismatched column count are still rows, as with csv.DictReader
+    ragged_rows = 0
+    def count_ragged_row(row) -> str:
+        nonlocal ragged_rows
+        ragged_rows += 1
+        return "skip"
+    
+    parse_options = pa_csv.ParseOptions(
+        newlines_in_values=True,
+        invalid_row_handler=count_ragged_row
+    )
+    try:
+        columns = pa_csv.open_csv(pa.py_buffer(content), parse_options=parse_options).schema.names
+        
+        # Only the first column is converted, as text, since just the row count is needed
+        convert_options = pa_csv.ConvertOptions(
+            column_types={columns[0]: pa.string()},
+            include_columns=columns[:1]
+        )
+        ragged_rows = 0
+        reader = pa_csv.open_csv(
+            pa.py_buffer(content),
+            parse_options=parse_options,
+            convert_options=convert_options
+        )
+        total_rows = sum(batch.num_rows for batch in reader) + ragged_rows
+    except pa.ArrowInvalid:
+        # pyarrow is stricter than upload validation (e.g. an unterminated quote),
+        # so files it rejects are counted with the lenient csv module instead
+        return _parse_csv_file_leniently(content)
+    
+    # Repeated header names collapse into one key, as in csv.DictReader rows
+    columns = list(dict.fromkeys(columns))
+    return {"total_rows": total_rows, "columns": columns if total_rows else []}
+
+def _parse_csv_file_leniently(content: bytes) -> Dict[str, Any]:
+    """Count rows and columns in a CSV chat file with csv.DictReader"""
+    text_stream = io.TextIOWrapper(io.BytesIO(content), encoding='utf-8', newline='')
+    total_rows = 0
+    columns = []
+    for row in csv.DictReader(text_stream):
+        if not total_rows:
+            columns = list(row.keys())
+        total_rows += 1
+    return {"total_rows": total_rows, "columns": columns}
 
 class ProcessingService:
     
@@ -17,8 +140,12 @@ class ProcessingService:
         if not upload:
             return False
         
+        # Get file content, and the summary if validation computed one
+        file_content = await db.get_file_content(upload_id)
+        content_summary = await db.get_content_summary(upload_id)
+        
         # Start background processing
-        asyncio.create_task(self._process_file(upload_id))
+        asyncio.create_task(self._process_file(upload, file_content, content_summary))
         return True
     
     async def get_results(self, upload_id: str, customer_id: str) -> List[ProcessingResult]:
@@ -29,28 +156,24 @@ class ProcessingService:
         
         return await db.get_processing_results(upload_id)
     
-    async def _process_file(self, upload_id: str):
+    async def _process_file(self, upload: Upload, file_content: Optional[bytes],
+                            content_summary: Optional[Dict[str, Any]] = None):
         """Background processing simulation"""
+        upload_id = upload.id
         try:
             # Update status to processing
             await db.update_upload_status(upload_id, UploadStatus.PROCESSING, 0)
             
-            # Get file content
-            file_content = await db.get_file_content(upload_id)
-            upload = db.uploads[upload_id]  # Direct access for demo
-            
             # Simulate processing with progress updates
             for progress in [25, 50, 75]:
                 await asyncio.sleep(1)  # Simulate work
                 await db.update_upload_status(upload_id, UploadStatus.PROCESSING, progress)
             
             # Process the file based on type
-            if upload.file_type == 'json':
-                results = await self._process_json_file(file_content, upload.filename)
-            elif upload.file_type == 'csv':
-                results = await self._process_csv_file(file_content, upload.filename)
-            else:
+            processor = self._PROCESSORS.get(upload.file_type)
+            if not processor:
                 raise ValueError(f"Unsupported file type: {upload.file_type}")
+            results = await processor(self, file_content, upload.filename, content_summary)
             
             # Save results
             await db.save_processing_results(upload_id, results)
@@ -63,80 +186,86 @@ class ProcessingService:
             await db.update_upload_status(upload_id, UploadStatus.FAILED, 0)
             print(f"Processing failed for {upload_id}: {str(e)}")
     
-    async def _process_json_file(self, content: bytes, filename: str) -> List[ProcessingResult]:
+    async def _process_json_file(self, content: bytes, filename: str,
+                                 content_summary: Optional[Dict[str, Any]] = None) -> List[ProcessingResult]:
         """Process JSON chat file"""
-        data = json.loads(content.decode('utf-8'))
+        # Validation already summarized the file unless it was uploaded another way
+        stats = content_summary or await summarize_json_file(content)
+        message_count = stats["message_count"]
+        participants = stats["participants"]
         
         # Mock processing results
         results = []
+        (average_message_length, sentiment_index, positive_messages,
+         negative_messages, neutral_messages) = _rng.integers(
+            [20, 0, 0, 0, 0],
+            [100, len(SENTIMENTS) - 1, message_count//2, message_count//4, message_count//2],
+            endpoint=True
+        ).tolist()
         
         # Message count analysis
-        if isinstance(data, list):
-            message_count = len(data)
-            participants = set()
-            
-            for item in data:
-                if isinstance(item, dict) and 'sender' in item:
-                    participants.add(item['sender'])
-        else:
-            message_count = 1
-            participants = {"unknown"}
-        
-        results.append(ProcessingResult(
+        results.append(ProcessingResult.model_construct(
             result_type="message_analysis",
             data={
                 "total_messages": message_count,
                 "unique_participants": len(participants),
-                "participants": list(participants),
-                "average_message_length": random.randint(20, 100)
+                "participants": participants,
+                "average_message_length": average_message_length
             },
-            created_at=datetime.utcnow()
+            created_at=utcnow()
         ))
         
         # Mock sentiment analysis
-        results.append(ProcessingResult(
+        results.append(ProcessingResult.model_construct(
             result_type="sentiment_analysis",
             data={
-                "overall_sentiment": random.choice(["positive", "neutral", "negative"]),
-                "sentiment_score": round(random.uniform(-1, 1), 2),
-                "positive_messages": random.randint(0, message_count//2),
-                "negative_messages": random.randint(0, message_count//4),
-                "neutral_messages": random.randint(0, message_count//2)
+                "overall_sentiment": SENTIMENTS[sentiment_index],
+                "sentiment_score": round(float(_rng.uniform(-1, 1)), 2),
+                "positive_messages": positive_messages,
+                "negative_messages": negative_messages,
+                "neutral_messages": neutral_messages
             },
-            created_at=datetime.utcnow()
+            created_at=utcnow()
         ))
         
         return results
     
-    async def _process_csv_file(self, content: bytes, filename: str) -> List[ProcessingResult]:
+    async def _process_csv_file(self, content: bytes, filename: str,
+                                content_summary: Optional[Dict[str, Any]] = None) -> List[ProcessingResult]:
         """Process CSV chat file"""
-        text_content = content.decode('utf-8')
-        csv_reader = csv.DictReader(io.StringIO(text_content))
-        
-        rows = list(csv_reader)
+        stats = await _run_in_process_pool(_parse_csv_file, content)
         results = []
         
         # Basic statistics
-        results.append(ProcessingResult(
+        results.append(ProcessingResult.model_construct(
             result_type="csv_analysis",
             data={
-                "total_rows": len(rows),
-                "columns": list(rows[0].keys()) if rows else [],
+                "total_rows": stats["total_rows"],
+                "columns": stats["columns"],
                 "file_size_kb": len(content) / 1024
             },
-            created_at=datetime.utcnow()
+            created_at=utcnow()
         ))
         
         # Mock conversation metrics
-        results.append(ProcessingResult(
+        peak_activity_hour, day_index, conversation_threads, response_time = _rng.integers(
+            [9, 0, 5, 2], [17, len(WEEKDAYS) - 1, 20, 30], endpoint=True
+        ).tolist()
+        results.append(ProcessingResult.model_construct(
             result_type="conversation_metrics",
             data={
-                "peak_activity_hour": random.randint(9, 17),
-                "most_active_day": random.choice(["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]),
-                "conversation_threads": random.randint(5, 20),
-                "average_response_time_minutes": random.randint(2, 30)
+                "peak_activity_hour": peak_activity_hour,
+                "most_active_day": WEEKDAYS[day_index],
+                "conversation_threads": conversation_threads,
+                "average_response_time_minutes": response_time
             },
-            created_at=datetime.utcnow()
+            created_at=utcnow()
         ))
         
-        return results
\ No newline at end of file
+        return results
+    
+    # Processor per file type, built once for the class; supporting a new type only needs an entry here
+    _PROCESSORS = {
+        FileType.JSON: _process_json_file,
+        FileType.CSV: _process_csv_file,
+    }
\ No newline at end of file
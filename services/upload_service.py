@@ -1,14 +1,15 @@
-from typing import List, Optional
-from models.database import db
-from models.schemas import Upload, DashboardSummaryResponse, UploadStatus
-from datetime import datetime
+from typing import Any, Dict, List, Optional
+from models.database import db, utcnow
+from models.schemas import FileType, Upload, DashboardSummaryResponse, UploadStatus
 
 class UploadService:
     
-    async def create_upload(self, customer_id: str, filename: str, 
-                          file_content: bytes, file_size: int) -> Upload:
+    async def create_upload(self, customer_id: str, filename: str, file_type: FileType,
+                          file_content: bytes, file_size: int,
+                          content_summary: Optional[Dict[str, Any]] = None) -> Upload:
         """Create a new upload record"""
-        upload = await db.create_upload(customer_id, filename, file_content, file_size)
+        upload = await db.create_upload(customer_id, filename, file_type, file_content,
+                                        file_size, content_summary)
         
         # Auto-trigger processing
         from services.processing_service import ProcessingService
@@ -32,20 +33,16 @@ class UploadService:
     
     async def get_customer_summary(self, customer_id: str) -> DashboardSummaryResponse:
         """Get summary statistics for a customer"""
-        uploads = await self.list_uploads(customer_id, limit=1000)  # Get all uploads
-        
-        total_uploads = len(uploads)
-        pending_uploads = len([u for u in uploads if u.status == UploadStatus.PENDING])
-        completed_uploads = len([u for u in uploads if u.status == UploadStatus.COMPLETED])
-        failed_uploads = len([u for u in uploads if u.status == UploadStatus.FAILED])
-        total_files_size = sum(u.file_size for u in uploads)
+        status_counts = await db.get_status_counts(customer_id)
+        total_uploads = sum(status_counts.values())
+        pending_uploads = status_counts[UploadStatus.PENDING]
+        completed_uploads = status_counts[UploadStatus.COMPLETED]
+        failed_uploads = status_counts[UploadStatus.FAILED]
+        total_files_size = await db.get_total_file_size(customer_id)
         
         # Uploads today
-        today = datetime.utcnow().date()
-        uploads_today = len([
-            u for u in uploads 
-            if u.upload_timestamp.date() == today
-        ])
+        today = utcnow().date()
+        uploads_today = await db.count_uploads_on(customer_id, today)
         
         return DashboardSummaryResponse(
             total_uploads=total_uploads,